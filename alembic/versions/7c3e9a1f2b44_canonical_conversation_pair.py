@@ -0,0 +1,76 @@
+"""canonical conversation pair
+
+Revision ID: 7c3e9a1f2b44
+Revises: 1218114348f8
+Create Date: 2026-10-19 10:12:40.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c3e9a1f2b44'
+down_revision: Union[str, Sequence[str], None] = '1218114348f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Store every pair as (min, max)
+    op.execute(
+        "UPDATE conversations SET user1 = user2, user2 = user1 "
+        "WHERE user1 > user2"
+    )
+    # Fold duplicate conversations into the oldest row for each pair
+    op.execute(
+        "UPDATE messages SET conversation_id = ("
+        " SELECT MIN(keep.id) FROM conversations dup"
+        " JOIN conversations keep"
+        " ON keep.user1 = dup.user1 AND keep.user2 = dup.user2"
+        " WHERE dup.id = messages.conversation_id"
+        ") WHERE conversation_id IN ("
+        " SELECT dup.id FROM conversations dup"
+        " JOIN conversations keep"
+        " ON keep.user1 = dup.user1 AND keep.user2 = dup.user2"
+        " AND keep.id < dup.id"
+        ")"
+    )
+    # The kept rows now hold messages newer than their own last_message and
+    # updated_at; recompute both from their newest message
+    newest = (
+        " FROM messages m WHERE m.conversation_id = conversations.id"
+        " ORDER BY m.created_at DESC, m.id DESC LIMIT 1"
+    )
+    op.execute(
+        "UPDATE conversations SET"
+        " last_message = (SELECT CASE WHEN LENGTH(m.text) > 50"
+        " THEN SUBSTR(m.text, 1, 50) || '...' ELSE m.text END" + newest + "),"
+        " updated_at = (SELECT m.created_at" + newest + ")"
+        " WHERE id IN ("
+        " SELECT keep.id FROM conversations keep"
+        " JOIN conversations dup"
+        " ON keep.user1 = dup.user1 AND keep.user2 = dup.user2"
+        " AND keep.id < dup.id"
+        ") AND EXISTS ("
+        " SELECT 1 FROM messages m WHERE m.conversation_id = conversations.id"
+        ")"
+    )
+    op.execute(
+        "DELETE FROM conversations WHERE id IN ("
+        " SELECT dup.id FROM conversations dup"
+        " JOIN conversations keep"
+        " ON keep.user1 = dup.user1 AND keep.user2 = dup.user2"
+        " AND keep.id < dup.id"
+        ")"
+    )
+    op.create_unique_constraint(
+        'uq_conversations_pair', 'conversations', ['user1', 'user2'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('uq_conversations_pair', 'conversations', type_='unique')
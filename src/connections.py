@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+import time
+import traceback
+
+# Server-driven heartbeats: sockets silent for HEARTBEAT_INTERVAL get a ping,
+# and are treated as half-open if nothing arrives HEARTBEAT_TIMEOUT after it.
+# The timeout also bounds each close/ping the reaper sends.
+HEARTBEAT_INTERVAL_SECONDS = float(os.getenv("WS_HEARTBEAT_INTERVAL_SECONDS", "25"))
+HEARTBEAT_TIMEOUT_SECONDS = float(os.getenv("WS_HEARTBEAT_TIMEOUT_SECONDS", "10"))
+# Sockets that send no chat frames for this long are closed. Off by default:
+# the bundled client does not reconnect, so an idle tab would go silently dead
+IDLE_TIMEOUT_SECONDS = float(os.getenv("WS_IDLE_TIMEOUT_SECONDS", "0"))
+
+PING_FRAME = json.dumps({"type": "ping"})
+
+
+class Connection:
+    """Per-socket state, kept small so idle sockets stay cheap"""
+
+    __slots__ = (
+        "websocket", "user_id", "user_name",
+        "last_seen", "last_activity", "ping_sent", "messages_in", "messages_out"
+    )
+
+    def __init__(self, websocket, user_id: int, user_name: str):
+        now = time.monotonic()
+        self.websocket = websocket
+        self.user_id = user_id
+        self.user_name = user_name
+        # Any inbound frame (including pongs) vs. actual chat traffic
+        self.last_seen = now
+        self.last_activity = now
+        # When the outstanding heartbeat ping went out, None if there is none
+        self.ping_sent = None
+        self.messages_in = 0
+        self.messages_out = 0
+
+    def touch(self, activity: bool = True):
+        self.last_seen = time.monotonic()
+        self.ping_sent = None
+        if activity:
+            self.last_activity = self.last_seen
+            self.messages_in += 1
+
+
+# Live WebSocket connections: user_id -> set of Connection (one per tab)
+connections = {}
+_reaper_task = None
+
+
+def register(conn: Connection):
+    connections.setdefault(conn.user_id, set()).add(conn)
+
+
+def unregister(conn: Connection):
+    """Remove a connection; safe to call more than once"""
+    sockets = connections.get(conn.user_id)
+    if sockets is None:
+        return
+    sockets.discard(conn)
+    if not sockets:
+        del connections[conn.user_id]
+
+
+async def _send(conn: Connection, text: str):
+    try:
+        await conn.websocket.send_text(text)
+        conn.messages_out += 1
+    except Exception:
+        # A failed send means the socket is gone; don't keep it around
+        unregister(conn)
+
+
+async def send_to_user(user_id: int, payload: dict):
+    """Send a payload to every open tab of a user"""
+    sockets = connections.get(user_id)
+    if not sockets:
+        return
+
+    # Encode once, however many tabs the user has open
+    text = json.dumps(payload)
+    # Copy the set to gracefully handle disconnections mid-loop
+    for conn in list(sockets):
+        await _send(conn, text)
+
+
+async def push_conversation_updated(conversation_id: int, participants, last_message: str, sender_id: int, updated_at):
+    """Push a compact inbox delta to every participant of a conversation"""
+    payload = {
+        "type": "conversation_updated",
+        "conversation_id": conversation_id,
+        "last_message": last_message,
+        "updated_at": updated_at.isoformat() if updated_at else None,
+        "sender_id": sender_id
+    }
+    for user_id in set(participants):
+        await send_to_user(user_id, payload)
+
+
+async def _close(conn: Connection, reason: str):
+    unregister(conn)
+    try:
+        await conn.websocket.close(code=1001, reason=reason)
+    except Exception:
+        pass
+
+
+async def sweep():
+    """Ping quiet sockets and reap half-open and idle ones"""
+    now = time.monotonic()
+    pending = []
+
+    for sockets in list(connections.values()):
+        for conn in list(sockets):
+            if conn.ping_sent is not None and now - conn.ping_sent > HEARTBEAT_TIMEOUT_SECONDS:
+                pending.append(_close(conn, "Heartbeat timeout"))
+            elif IDLE_TIMEOUT_SECONDS and now - conn.last_activity > IDLE_TIMEOUT_SECONDS:
+                pending.append(_close(conn, "Idle timeout"))
+            elif conn.ping_sent is None and now - conn.last_seen > HEARTBEAT_INTERVAL_SECONDS:
+                conn.ping_sent = now
+                pending.append(_send(conn, PING_FRAME))
+
+    # One stuck peer must not hold up the rest of the sweep. A ping that
+    # times out is left outstanding, so the next sweep reaps that socket.
+    await asyncio.gather(
+        *(asyncio.wait_for(op, HEARTBEAT_TIMEOUT_SECONDS) for op in pending),
+        return_exceptions=True
+    )
+
+
+async def _run_reaper():
+    # Sweeping at half the timeout bounds how long a dead socket lingers
+    period = max(1.0, min(HEARTBEAT_INTERVAL_SECONDS, HEARTBEAT_TIMEOUT_SECONDS) / 2)
+    while True:
+        await asyncio.sleep(period)
+        try:
+            await sweep()
+        except Exception:
+            traceback.print_exc()
+
+
+def start_reaper():
+    global _reaper_task
+    _reaper_task = asyncio.create_task(_run_reaper())
+
+
+def stop_reaper():
+    global _reaper_task
+    if _reaper_task:
+        _reaper_task.cancel()
+        _reaper_task = None
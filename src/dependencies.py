@@ -1,23 +1,44 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from src.utility import verify_token
+from src.revocation import revocation_list
+from src.tracing import span
 
 security = HTTPBearer()
 
-async def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depends(security)) -> int:
-    """Dependency to get current user ID from JWT token"""
+async def get_current_token_payload(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Dependency to get the verified, unrevoked JWT payload"""
     try:
-        payload = verify_token(credentials.credentials)
-        user_id = payload.get("sub")
-        if not user_id:
+        with span("dependencies.get_current_user_id"):
+            payload = verify_token(credentials.credentials)
+            # Refresh tokens are only good for /auth/refresh
+            if payload.get("type") != "access":
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Invalid token type"
+                )
+            with span("auth.revocation_check"):
+                revoked = await revocation_list.is_revoked(payload.get("jti"))
+        if revoked:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token payload"
+                detail="Token has been revoked"
             )
-        return int(user_id)
+        return payload
     except HTTPException:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+async def get_current_user_id(payload: dict = Depends(get_current_token_payload)) -> int:
+    """Dependency to get current user ID from JWT token"""
+    user_id = payload.get("sub")
+    if not user_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return int(user_id)
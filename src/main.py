@@ -2,7 +2,11 @@ from fastapi import FastAPI
 from fastapi.responses import HTMLResponse
 from fastapi.middleware.cors import CORSMiddleware
 from src.database import engine, Base
-from src.routes import auth, websocket
+from src.routes import auth, websocket, debug, attachments
+from src.revocation import revocation_list
+from src.connections import start_reaper, stop_reaper
+from src.services import start_upload_reaper, stop_upload_reaper
+from src.tracing import TRACING_ENABLED, TracingMiddleware
 
 app = FastAPI()
 
@@ -15,9 +19,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Root trace per HTTP request (only installed when TRACE_ENABLED=1)
+if TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(websocket.router)
+app.include_router(attachments.router)
+app.include_router(debug.router)
 
 @app.get("/")
 async def get():
@@ -29,4 +39,13 @@ async def get():
 @app.on_event("startup")
 async def startup():
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
+    await revocation_list.start()
+    start_reaper()
+    start_upload_reaper()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await revocation_list.stop()
+    stop_reaper()
+    stop_upload_reaper()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
 from sqlalchemy.sql import func
 from src.database import Base
 
@@ -15,6 +15,10 @@ class User(Base):
 # 💬 Conversation
 class Conversation(Base):
     __tablename__ = "conversations"
+    # Participants are stored in canonical order: user1 = min, user2 = max
+    __table_args__ = (
+        UniqueConstraint("user1", "user2", name="uq_conversations_pair"),
+    )
 
     id = Column(Integer, primary_key=True)
     user1 = Column(Integer, ForeignKey("users.id"))
@@ -31,4 +35,46 @@ class Message(Base):
     conversation_id = Column(Integer, ForeignKey("conversations.id"))
     sender_id = Column(Integer, ForeignKey("users.id"))
     text = Column(String)
-    created_at = Column(DateTime, server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime, server_default=func.now())
+
+
+# 📎 Attachment (file stored on disk under its sha256)
+class Attachment(Base):
+    __tablename__ = "attachments"
+
+    id = Column(Integer, primary_key=True)
+    message_id = Column(Integer, ForeignKey("messages.id"), nullable=True, index=True)
+    uploader_id = Column(Integer, ForeignKey("users.id"))
+    sha256 = Column(String, index=True)
+    filename = Column(String)
+    content_type = Column(String)
+    size = Column(Integer)
+    created_at = Column(DateTime, server_default=func.now())
+
+
+# ⬆️ Upload in progress (resumable, chunked)
+class Upload(Base):
+    __tablename__ = "uploads"
+
+    id = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    filename = Column(String)
+    content_type = Column(String)
+    size = Column(Integer)
+    received = Column(Integer, default=0)
+    created_at = Column(DateTime, server_default=func.now())
+    # Bumped by every accepted chunk; stale uploads expire from here
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), index=True)
+
+
+# 🚫 Revoked token
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    id = Column(Integer, primary_key=True)
+    jti = Column(String, unique=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    # "access" or "refresh"; only access revocations are mirrored in memory
+    token_type = Column(String, default="access")
+    expires_at = Column(DateTime, index=True)
+    revoked_at = Column(DateTime, server_default=func.now(), index=True)
\ No newline at end of file
@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import math
+import os
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.database import SessionLocal
+from src.models import RevokedToken
+
+# Sized for the number of unexpired revocations we expect to hold at once
+BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+BLOOM_ERROR_RATE = float(os.getenv("REVOCATION_BLOOM_ERROR_RATE", "0.001"))
+# Recently seen revocations (and confirmed Bloom false positives) answered
+# without touching the store
+EXACT_SET_MAX = int(os.getenv("REVOCATION_EXACT_SET_MAX", "4096"))
+REFRESH_INTERVAL_SECONDS = float(os.getenv("REVOCATION_REFRESH_SECONDS", "5"))
+REBUILD_INTERVAL_SECONDS = float(os.getenv("REVOCATION_REBUILD_SECONDS", "300"))
+# Each refresh re-reads this much history before the newest revoked_at seen.
+# Rows become visible in commit order, not id or timestamp order, so a
+# strict high-water mark could skip a revocation committed late by another
+# worker. The window only has to outlast one revoke transaction.
+SYNC_OVERLAP_SECONDS = float(os.getenv("REVOCATION_SYNC_OVERLAP_SECONDS", "60"))
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RevocationList:
+    """In-memory mirror of the revoked_tokens table.
+
+    Every unexpired revoked access-token jti is in the Bloom filter, so a
+    negative answer needs no I/O. Positives are confirmed against small exact
+    sets of recent revocations and known false positives, and only fall
+    through to the database when both miss. Refresh tokens are never checked
+    here (reuse is caught by the unique insert), so they stay out of memory.
+    """
+
+    def __init__(self):
+        self.bloom = BloomFilter(BLOOM_CAPACITY, BLOOM_ERROR_RATE)
+        self.recent = set()
+        # Bloom positives the store said are not revoked
+        self.false_positives = set()
+        # Newest revoked_at seen, in database time
+        self.synced_through = None
+        self.rebuilt_at = 0.0
+        self._task = None
+
+    def _remember(self, jti: str):
+        self.bloom.add(jti)
+        self.false_positives.discard(jti)
+        if len(self.recent) >= EXACT_SET_MAX:
+            # Everything stays in the Bloom filter, so dropping the exact set
+            # only sends a few more lookups to the store
+            self.recent.clear()
+        self.recent.add(jti)
+
+    def _remember_negative(self, jti: str):
+        if len(self.false_positives) >= EXACT_SET_MAX:
+            self.false_positives.clear()
+        self.false_positives.add(jti)
+
+    async def rebuild(self):
+        """Reload the filter from unexpired access revocations and purge expired rows"""
+        now = datetime.utcnow()
+        bloom = BloomFilter(BLOOM_CAPACITY, BLOOM_ERROR_RATE)
+        synced_through = None
+
+        async with SessionLocal() as session:
+            await session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+            await session.commit()
+            result = await session.execute(
+                select(RevokedToken.jti, RevokedToken.revoked_at)
+                .where(RevokedToken.token_type == "access", RevokedToken.expires_at > now)
+            )
+            for jti, revoked_at in result:
+                bloom.add(jti)
+                if synced_through is None or revoked_at > synced_through:
+                    synced_through = revoked_at
+
+        # Keep revocations noted locally while the reload was running
+        for jti in self.recent:
+            bloom.add(jti)
+
+        self.bloom = bloom
+        # Answers against the old filter; the new one has other collisions
+        self.false_positives = set()
+        if synced_through is not None:
+            self.synced_through = max(synced_through, self.synced_through or synced_through)
+        self.rebuilt_at = time.monotonic()
+
+    async def refresh(self):
+        """Pull revocations written by other workers since the last sync"""
+        query = select(RevokedToken.jti, RevokedToken.revoked_at).where(RevokedToken.token_type == "access")
+        if self.synced_through is not None:
+            query = query.where(
+                RevokedToken.revoked_at >= self.synced_through - timedelta(seconds=SYNC_OVERLAP_SECONDS))
+
+        async with SessionLocal() as session:
+            result = await session.execute(query)
+            for jti, revoked_at in result:
+                self._remember(jti)
+                if self.synced_through is None or revoked_at > self.synced_through:
+                    self.synced_through = revoked_at
+
+    async def is_revoked(self, jti: str) -> bool:
+        """Check a token id, hitting the store only on Bloom filter positives"""
+        if not jti or jti not in self.bloom:
+            return False
+        if jti in self.recent:
+            return True
+        if jti in self.false_positives:
+            return False
+
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(RevokedToken.id).where(RevokedToken.jti == jti)
+            )
+            revoked = result.scalar_one_or_none() is not None
+
+        if revoked:
+            self._remember(jti)
+        else:
+            self._remember_negative(jti)
+        return revoked
+
+    async def revoke(self, db: AsyncSession, jti: str, user_id: int, expires_at: int,
+                     token_type: str = "access") -> bool:
+        """Persist a revocation. Returns False if the token was already revoked."""
+        db.add(RevokedToken(
+            jti=jti,
+            user_id=user_id,
+            token_type=token_type,
+            expires_at=datetime.utcfromtimestamp(expires_at)
+        ))
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            revoked = False
+        else:
+            revoked = True
+
+        if token_type == "access":
+            self._remember(jti)
+        return revoked
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(REFRESH_INTERVAL_SECONDS)
+            try:
+                if time.monotonic() - self.rebuilt_at >= REBUILD_INTERVAL_SECONDS:
+                    await self.rebuild()
+                else:
+                    await self.refresh()
+            except Exception:
+                traceback.print_exc()
+
+    async def start(self):
+        await self.rebuild()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+
+revocation_list = RevocationList()
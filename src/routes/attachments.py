@@ -0,0 +1,70 @@
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import FileResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.schemas import UploadCreate, UploadStatus, AttachmentResponse
+from src.services import (
+    create_upload, get_upload_status, upload_chunk,
+    complete_upload, get_attachment
+)
+from src.storage import blob_path
+from src.database import get_db
+from src.dependencies import get_current_user_id
+
+router = APIRouter(tags=["Attachments"])
+
+
+@router.post("/attachments/uploads", response_model=UploadStatus)
+async def start_upload(
+    data: UploadCreate,
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """Start a resumable upload"""
+    return await create_upload(current_user_id, data, db)
+
+
+@router.get("/attachments/uploads/{upload_id}", response_model=UploadStatus)
+async def upload_status(
+    upload_id: str,
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the current offset of an upload (to resume it)"""
+    return await get_upload_status(upload_id, current_user_id, db)
+
+
+@router.put("/attachments/uploads/{upload_id}", response_model=UploadStatus)
+async def put_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """Append a chunk (raw request body) at offset"""
+    return await upload_chunk(upload_id, current_user_id, offset, request.stream(), db)
+
+
+@router.post("/attachments/uploads/{upload_id}/complete", response_model=AttachmentResponse)
+async def finish_upload(
+    upload_id: str,
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """Finish an upload and get the attachment id to send with a message"""
+    return await complete_upload(upload_id, current_user_id, db)
+
+
+@router.get("/attachments/{attachment_id}")
+async def download_attachment(
+    attachment_id: int,
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """Download an attachment (supports Range requests)"""
+    attachment = await get_attachment(attachment_id, current_user_id, db)
+    return FileResponse(
+        blob_path(attachment.sha256),
+        media_type=attachment.content_type,
+        filename=attachment.filename
+    )
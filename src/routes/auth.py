@@ -1,20 +1,20 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from src.schemas import (
-    UserRegister, UserLogin, Token, RefreshTokenRequest,
+    UserRegister, UserLogin, Token, RefreshTokenRequest, LogoutRequest,
     UserProfile, UserListItem, ConversationWithUser,
     ConversationCreate, MessageResponse, MessageCreate,
-    MessageWithSender
+    MessageWithSender, BulkMessageCreate, BulkMessageResponse
 )
 from src.services import (
-    register_user, login_user, refresh_user_token,
+    register_user, login_user, refresh_user_token, logout_user,
     get_current_user_profile, get_all_users,
     get_or_create_conversation, get_user_conversations,
-    get_conversation_messages, send_message
+    get_conversation_messages, send_message, send_messages_bulk
 )
 from src.database import get_db
-from src.dependencies import get_current_user_id
-from typing import List
+from src.dependencies import get_current_user_id, get_current_token_payload
+from typing import List, Optional
 
 router = APIRouter(tags=["API"])
 
@@ -34,15 +34,19 @@ async def login(user: UserLogin, db: AsyncSession = Depends(get_db)):
 
 
 @router.post("/auth/refresh", response_model=Token)
-async def refresh(req: RefreshTokenRequest):
-    """Refresh access token"""
-    return await refresh_user_token(req.refresh_token)
+async def refresh(req: RefreshTokenRequest, db: AsyncSession = Depends(get_db)):
+    """Refresh access token (the old refresh token is revoked)"""
+    return await refresh_user_token(req.refresh_token, db)
 
 
 @router.post("/auth/logout")
-async def logout(current_user_id: int = Depends(get_current_user_id)):
-    """Logout user (Client should discard the token)"""
-    return {"message": "Successfully logged out"}
+async def logout(
+    req: Optional[LogoutRequest] = None,
+    payload: dict = Depends(get_current_token_payload),
+    db: AsyncSession = Depends(get_db)
+):
+    """Logout user by revoking the access token and optional refresh token"""
+    return await logout_user(payload, req.refresh_token if req else None, db)
 
 # ============= USER ENDPOINTS =============
 
@@ -107,4 +111,14 @@ async def create_message(
     db: AsyncSession = Depends(get_db)
 ):
     """Send a message in a conversation"""
-    return await send_message(conversation_id, current_user_id, message.text, db)
+    return await send_message(conversation_id, current_user_id, message.text, db, message.attachment_ids)
+
+
+@router.post("/messages/bulk", response_model=BulkMessageResponse)
+async def create_messages_bulk(
+    data: BulkMessageCreate,
+    current_user_id: int = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_db)
+):
+    """Send many messages at once (bots and integrations)"""
+    return await send_messages_bulk(current_user_id, data, db)
@@ -0,0 +1,48 @@
+import asyncio
+import ipaddress
+import threading
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+from src.dependencies import get_current_user_id
+from src.tracing import (
+    PROFILER_ENABLED, PROFILER_MAX_SECONDS, PROFILER_ALLOWED_USER_IDS, profiler_lock, sample_stacks
+)
+
+router = APIRouter(tags=["Debug"])
+
+
+def _is_loopback(request: Request) -> bool:
+    try:
+        return ipaddress.ip_address(request.client.host).is_loopback
+    except (AttributeError, ValueError):
+        return False
+
+
+@router.get("/debug/profile", response_class=PlainTextResponse)
+async def profile(
+    request: Request,
+    seconds: float = Query(min(10, PROFILER_MAX_SECONDS), gt=0, le=PROFILER_MAX_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """Sample the event loop thread for a while and return collapsed stacks (flamegraph input)"""
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    # Stacks expose internals, so any logged-in user is not enough
+    if PROFILER_ALLOWED_USER_IDS:
+        allowed = current_user_id in PROFILER_ALLOWED_USER_IDS
+    else:
+        allowed = _is_loopback(request)
+    if not allowed:
+        raise HTTPException(status_code=403, detail="Not authorized to profile")
+
+    if not profiler_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profile is already running")
+
+    try:
+        # This handler runs on the event loop thread; sample it from a worker
+        loop_thread_id = threading.get_ident()
+        return await asyncio.to_thread(sample_stacks, loop_thread_id, seconds, interval_ms / 1000)
+    finally:
+        profiler_lock.release()
@@ -1,11 +1,120 @@
+import json
+import traceback
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from src.utility import verify_token
 from src.database import SessionLocal
+from src.revocation import revocation_list
+from src.connections import (
+    Connection, register, unregister, send_to_user, push_conversation_updated
+)
+from src.services import message_preview, attach_to_message
+from src.tracing import trace, span
 from sqlalchemy import select
-from src.models import Message, Conversation
+from src.models import Message, Conversation, User
 
 router = APIRouter()
-connections = {}
+
+
+async def handle_frame(conn: Connection, raw: str):
+    """Decode one client frame, store the message and fan it out"""
+    websocket = conn.websocket
+    user_id = conn.user_id
+
+    with span("ws.decode"):
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            data = None
+    if not isinstance(data, dict):
+        conn.touch(activity=False)
+        return
+
+    frame_type = data.get("type")
+    if frame_type == "pong":
+        conn.touch(activity=False)
+        return
+    if frame_type == "ping":
+        conn.touch(activity=False)
+        await websocket.send_json({"type": "pong"})
+        return
+
+    conn.touch()
+    conversation_id = data.get("conversation_id")
+    text = data.get("text") or ""
+    attachment_ids = data.get("attachment_ids")
+    if not isinstance(attachment_ids, list):
+        attachment_ids = []
+    attachment_ids = [i for i in attachment_ids if isinstance(i, int)]
+
+    if not conversation_id or not (text or attachment_ids):
+        return
+
+    with span("ws.persist"):
+        async with SessionLocal() as session:
+            # Find the receiver from conversation
+            result = await session.execute(select(Conversation).where(Conversation.id == conversation_id))
+            conversation = result.scalar_one_or_none()
+
+            if not conversation:
+                return
+
+            receiver_id = conversation.user2 if conversation.user1 == user_id else conversation.user1
+
+            # Store message in database
+            msg = Message(
+                conversation_id=conversation_id,
+                sender_id=user_id,
+                text=text
+            )
+            session.add(msg)
+
+            # Only descriptors travel over the socket; files are fetched via
+            # GET /attachments/{id}
+            attachments = []
+            if attachment_ids:
+                await session.flush()
+                attachments = await attach_to_message(msg.id, user_id, attachment_ids, session)
+                if not text and not attachments:
+                    return
+
+            # Update conversation last message
+            conversation.last_message = message_preview(text, attachments)
+
+            await session.commit()
+            await session.refresh(msg)
+
+    message_payload = {
+        "id": msg.id,
+        "conversation_id": conversation_id,
+        "sender_id": user_id,
+        "sender_name": conn.user_name,
+        "text": text,
+        "created_at": msg.created_at.isoformat() if msg.created_at else None,
+        "attachments": [attachment.model_dump() for attachment in attachments]
+    }
+
+    with span("ws.fanout"):
+        # If receiver is online -> Send message instantly via WebSocket to all their open tabs
+        await send_to_user(receiver_id, message_payload)
+
+        # Send message back to sender so they can render it locally across all their tabs
+        if receiver_id != user_id:
+            await send_to_user(user_id, message_payload)
+
+        # Inbox delta for both participants; updated_at was set to now()
+        # in the same transaction that stamped the message
+        await push_conversation_updated(
+            conversation.id, (conversation.user1, conversation.user2),
+            conversation.last_message, user_id, msg.created_at
+        )
+
+
+async def _get_user_name(user_id: int) -> str:
+    # Kept out of websocket_endpoint: locals of that frame live as long as
+    # the socket, and a session/result left there pins ~14 KB per connection
+    async with SessionLocal() as session:
+        result = await session.execute(select(User.name).where(User.id == user_id))
+        return result.scalar_one_or_none() or "someone"
 
 
 @router.websocket("/ws")
@@ -16,90 +125,44 @@ async def websocket_endpoint(websocket: WebSocket):
         await websocket.close(code=1008, reason="Token required")
         return
 
-    try:
-        payload = verify_token(token)
-        user_id = int(payload.get("sub"))
-        # Using a global conversation for now to match frontend behavior
-        conversation_id = 1
-    except Exception:
-        await websocket.close(code=1008, reason="Invalid token")
-        return
-
-    await websocket.accept()
-    if user_id not in connections:
-        connections[user_id] = set()
-    connections[user_id].add(websocket)
+    with trace("ws.connect"):
+        try:
+            payload = verify_token(token)
+            if payload.get("type") != "access":
+                raise ValueError("Not an access token")
+            with span("auth.revocation_check"):
+                revoked = await revocation_list.is_revoked(payload.get("jti"))
+            if revoked:
+                raise ValueError("Token revoked")
+            user_id = int(payload.get("sub"))
+        except Exception:
+            await websocket.close(code=1008, reason="Invalid token")
+            return
+
+        # Resolve the sender name once per connection instead of per message
+        user_name = await _get_user_name(user_id)
+
+        await websocket.accept()
+
+    conn = Connection(websocket, user_id, user_name)
+    register(conn)
     print(f"User {user_id} connected")
 
     try:
         while True:
-            data = await websocket.receive_json()
-            conversation_id = data.get("conversation_id")
-            text = data.get("text")
-
-            if not conversation_id or not text:
-                continue
-
-            async with SessionLocal() as session:
-                # Find the receiver from conversation
-                result = await session.execute(select(Conversation).where(Conversation.id == conversation_id))
-                conversation = result.scalar_one_or_none()
-
-                if not conversation:
-                    continue
-
-                receiver_id = conversation.user2 if conversation.user1 == user_id else conversation.user1
-
-                # Store message in database
-                msg = Message(
-                    conversation_id=conversation_id,
-                    sender_id=user_id,
-                    text=text
-                )
-                session.add(msg)
-
-                # Update conversation last message
-                conversation.last_message = text[:50] + \
-                    "..." if len(text) > 50 else text
-
-                await session.commit()
-                await session.refresh(msg)
-
-                # Payload to send
-                # Fetch sender user to get name for notification
-                from src.models import User
-                sender_result = await session.execute(select(User).where(User.id == user_id))
-                sender = sender_result.scalar_one_or_none()
-
-                message_payload = {
-                    "id": msg.id,
-                    "conversation_id": conversation_id,
-                    "sender_id": user_id,
-                    "sender_name": sender.name if sender else "someone",
-                    "text": text,
-                    "created_at": msg.created_at.isoformat() if msg.created_at else None
-                }
-
-            # If receiver is online -> Send message instantly via WebSocket to all their open tabs
-            if receiver_id in connections:
-                # Copy the set to gracefully handle disconnections mid-loop
-                for conn in list(connections[receiver_id]):
-                    try:
-                        await conn.send_json(message_payload)
-                    except Exception:
-                        pass
-
-            # Send message back to sender so they can render it locally across all their tabs
-            if user_id in connections:
-                for conn in list(connections[user_id]):
-                    try:
-                        await conn.send_json(message_payload)
-                    except Exception:
-                        pass
+            raw = await websocket.receive_text()
+            with trace("ws.frame"):
+                await handle_frame(conn, raw)
     except WebSocketDisconnect:
-        if user_id in connections:
-            if websocket in connections[user_id]:
-                connections[user_id].remove(websocket)
-            if not connections[user_id]:
-                del connections[user_id]
+        pass
+    except Exception:
+        # Anything else (DB errors, sends on a dead socket) still ends the
+        # connection; the finally below makes sure it leaves the registry
+        traceback.print_exc()
+        try:
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        unregister(conn)
         print(f"User {user_id} disconnected")
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
 
 # ============= AUTH SCHEMAS =============
@@ -21,6 +21,9 @@ class Token(BaseModel):
 class RefreshTokenRequest(BaseModel):
     refresh_token: str
 
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
 # ============= USER SCHEMAS =============
 
 class UserProfile(BaseModel):
@@ -62,10 +65,36 @@ class ConversationWithUser(BaseModel):
     last_message: Optional[str]
     updated_at: datetime
 
+# ============= ATTACHMENT SCHEMAS =============
+
+class UploadCreate(BaseModel):
+    filename: str
+    content_type: Optional[str] = None
+    size: int
+
+class UploadStatus(BaseModel):
+    upload_id: str
+    offset: int
+    size: int
+    chunk_size: int
+
+class AttachmentDescriptor(BaseModel):
+    id: int
+    filename: str
+    content_type: str
+    size: int
+
+    class Config:
+        from_attributes = True
+
+class AttachmentResponse(AttachmentDescriptor):
+    sha256: str
+
 # ============= MESSAGE SCHEMAS =============
 
 class MessageCreate(BaseModel):
     text: str
+    attachment_ids: List[int] = []
 
 class MessageResponse(BaseModel):
     id: int
@@ -73,6 +102,7 @@ class MessageResponse(BaseModel):
     sender_id: int
     text: str
     created_at: datetime
+    attachments: List[AttachmentDescriptor] = []
     
     class Config:
         from_attributes = True
@@ -85,3 +115,24 @@ class MessageWithSender(BaseModel):
     text: str
     created_at: datetime
     is_own: bool = False
+    attachments: List[AttachmentDescriptor] = []
+
+class BulkMessageItem(BaseModel):
+    conversation_id: int
+    text: str
+
+class BulkMessageCreate(BaseModel):
+    # Either explicit items, or one text for many conversations (or both)
+    items: List[BulkMessageItem] = []
+    text: Optional[str] = None
+    conversation_ids: List[int] = []
+
+class BulkMessageResult(BaseModel):
+    conversation_id: int
+    status: str  # "sent", "empty", "not_found" or "forbidden"
+    message_id: Optional[int] = None
+
+class BulkMessageResponse(BaseModel):
+    sent: int
+    failed: int
+    results: List[BulkMessageResult]
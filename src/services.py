@@ -1,16 +1,40 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_, and_
+from sqlalchemy import select, or_, insert, update, delete, case, func, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from fastapi import HTTPException
-from src.models import User, Conversation, Message
+from typing import Optional, List
+import asyncio
+import os
+import traceback
+import uuid
+from datetime import timedelta
+from src.database import SessionLocal
+from src.models import User, Conversation, Message, Attachment, Upload
 from src.schemas import (
     UserRegister, UserLogin, Token, UserProfile,
-    ConversationWithUser, MessageWithSender
+    ConversationWithUser, MessageWithSender, MessageResponse,
+    BulkMessageCreate, BulkMessageResult, BulkMessageResponse,
+    UploadCreate, UploadStatus, AttachmentDescriptor, AttachmentResponse
 )
 from src.utility import hash_password, verify_password, create_access_token, create_refresh_token, verify_token
+from src.revocation import revocation_list
+from src.connections import send_to_user, push_conversation_updated
+from src.tracing import traced
+from src.storage import (
+    MAX_ATTACHMENT_BYTES, CHUNK_SIZE, UPLOAD_EXPIRY_SECONDS, MAX_OPEN_UPLOADS,
+    create_upload_file, remove_upload_file, chunk_path, remove_file,
+    write_chunk, splice_chunk, finalize_upload
+)
+
+MAX_BULK_MESSAGES = 1000
+
+_upload_reaper_task = None
 
 # ============= AUTH SERVICES =============
 
 
+@traced("services.register_user")
 async def register_user(user: UserRegister, db: AsyncSession):
     """Register a new user"""
     try:
@@ -44,6 +68,7 @@ async def register_user(user: UserRegister, db: AsyncSession):
             status_code=500, detail=f"Registration failed: {str(e)}")
 
 
+@traced("services.login_user")
 async def login_user(user: UserLogin, db: AsyncSession) -> Token:
     """Login user and return JWT tokens"""
     result = await db.execute(select(User).where(User.email == user.email))
@@ -62,23 +87,60 @@ async def login_user(user: UserLogin, db: AsyncSession) -> Token:
     return Token(access_token=access_token, refresh_token=refresh_token)
 
 
-async def refresh_user_token(refresh_token: str) -> Token:
-    """Refresh access token using refresh token"""
+@traced("services.refresh_user_token")
+async def refresh_user_token(refresh_token: str, db: AsyncSession) -> Token:
+    """Rotate a refresh token: revoke the presented one and issue a new pair"""
     try:
         payload = verify_token(refresh_token)
-        user_id = payload.get("sub")
-        email = payload.get("email")
     except HTTPException:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
 
+    if payload.get("type") != "refresh" or not payload.get("jti"):
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+    user_id = payload.get("sub")
+    email = payload.get("email")
+
+    # The insert is the authoritative check: a token can only be spent once
+    if not await revocation_list.revoke(db, payload["jti"], int(user_id), payload["exp"], "refresh"):
+        raise HTTPException(
+            status_code=401, detail="Refresh token has been revoked")
+
     new_access_token = create_access_token({"sub": user_id, "email": email})
     new_refresh_token = create_refresh_token({"sub": user_id, "email": email})
 
     return Token(access_token=new_access_token, refresh_token=new_refresh_token)
 
+
+@traced("services.logout_user")
+async def logout_user(access_payload: dict, refresh_token: Optional[str], db: AsyncSession):
+    """Revoke the caller's access token and, if given, their refresh token"""
+    user_id = int(access_payload["sub"])
+
+    # Validate the refresh token before revoking anything, so a bad one
+    # doesn't leave the session half logged out
+    refresh_payload = None
+    if refresh_token:
+        try:
+            refresh_payload = verify_token(refresh_token)
+        except HTTPException:
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+        if refresh_payload.get("type") != "refresh" or refresh_payload.get("sub") != access_payload["sub"]:
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+
+    if access_payload.get("jti"):
+        await revocation_list.revoke(db, access_payload["jti"], user_id, access_payload["exp"])
+
+    if refresh_payload and refresh_payload.get("jti"):
+        await revocation_list.revoke(db, refresh_payload["jti"], user_id, refresh_payload["exp"], "refresh")
+
+    return {"message": "Successfully logged out"}
+
 # ============= USER SERVICES =============
 
 
+@traced("services.get_current_user_profile")
 async def get_current_user_profile(user_id: int, db: AsyncSession) -> UserProfile:
     """Get current user's profile"""
     result = await db.execute(select(User).where(User.id == user_id))
@@ -90,6 +152,7 @@ async def get_current_user_profile(user_id: int, db: AsyncSession) -> UserProfil
     return UserProfile.from_orm(user)
 
 
+@traced("services.get_all_users")
 async def get_all_users(current_user_id: int, db: AsyncSession):
     """Get all users except current user"""
     result = await db.execute(select(User).where(User.id != current_user_id))
@@ -99,33 +162,53 @@ async def get_all_users(current_user_id: int, db: AsyncSession):
 # ============= CONVERSATION SERVICES =============
 
 
-async def get_or_create_conversation(user1_id: int, user2_id: int, db: AsyncSession):
-    """Get existing conversation or create new one"""
-    # Check if conversation already exists (in either direction)
-    result = await db.execute(
-        select(Conversation).where(
-            or_(
-                and_(Conversation.user1 == user1_id,
-                     Conversation.user2 == user2_id),
-                and_(Conversation.user1 == user2_id,
-                     Conversation.user2 == user1_id)
-            )
-        )
+def _sqlite_upsert_conversation(low: int, high: int):
+    # SQLite has no data-modifying CTEs; the no-op DO UPDATE makes RETURNING
+    # yield the existing row when the pair is already there
+    stmt = sqlite_insert(Conversation).values(user1=low, user2=high)
+    return stmt.on_conflict_do_update(
+        index_elements=[Conversation.user1, Conversation.user2],
+        set_={"user1": stmt.excluded.user1}
+    ).returning(Conversation)
+
+
+def _pg_upsert_conversation(low: int, high: int):
+    # WITH ins AS (INSERT ... ON CONFLICT DO NOTHING RETURNING *)
+    # SELECT * FROM ins UNION ALL SELECT * FROM conversations WHERE pair.
+    # Looking up an existing pair writes nothing and takes no row lock.
+    table = Conversation.__table__
+    ins = (
+        pg_insert(table).values(user1=low, user2=high)
+        .on_conflict_do_nothing(index_elements=[table.c.user1, table.c.user2])
+        .returning(*table.c)
+        .cte("ins")
     )
-    conversation = result.scalar_one_or_none()
+    existing = select(*table.c).where(table.c.user1 == low, table.c.user2 == high)
+    return select(Conversation).from_statement(union_all(select(*ins.c), existing))
 
-    if conversation:
-        return conversation
 
-    # Create new conversation
-    new_conversation = Conversation(user1=user1_id, user2=user2_id)
-    db.add(new_conversation)
+@traced("services.get_or_create_conversation")
+async def get_or_create_conversation(user1_id: int, user2_id: int, db: AsyncSession):
+    """Get existing conversation or create new one"""
+    low, high = min(user1_id, user2_id), max(user1_id, user2_id)
+
+    if db.bind.dialect.name == "sqlite":
+        result = await db.execute(_sqlite_upsert_conversation(low, high))
+        conversation = result.scalar_one()
+    else:
+        result = await db.execute(_pg_upsert_conversation(low, high))
+        conversation = result.scalars().first()
+        if conversation is None:
+            # A concurrent insert committed after our snapshot was taken:
+            # DO NOTHING skipped it and the SELECT couldn't see it yet
+            result = await db.execute(_pg_upsert_conversation(low, high))
+            conversation = result.scalars().one()
     await db.commit()
-    await db.refresh(new_conversation)
 
-    return new_conversation
+    return conversation
 
 
+@traced("services.get_user_conversations")
 async def get_user_conversations(user_id: int, db: AsyncSession):
     """Get all conversations for a user with other user details"""
     result = await db.execute(
@@ -161,6 +244,33 @@ async def get_user_conversations(user_id: int, db: AsyncSession):
 # ============= MESSAGE SERVICES =============
 
 
+def message_preview(text: str, attachments=()) -> str:
+    """Shortened text stored as a conversation's last_message"""
+    if not text and attachments:
+        text = f"📎 {attachments[0].filename}"
+    return text[:50] + "..." if len(text) > 50 else text
+
+
+async def attach_to_message(message_id: int, uploader_id: int, attachment_ids, db: AsyncSession) -> List[AttachmentDescriptor]:
+    """Link the sender's unattached uploads to a message"""
+    result = await db.execute(
+        update(Attachment)
+        .where(
+            Attachment.id.in_(set(attachment_ids)),
+            Attachment.uploader_id == uploader_id,
+            Attachment.message_id.is_(None)
+        )
+        .values(message_id=message_id)
+        .returning(Attachment.id, Attachment.filename, Attachment.content_type, Attachment.size)
+        .execution_options(synchronize_session=False)
+    )
+    return [
+        AttachmentDescriptor(id=row.id, filename=row.filename, content_type=row.content_type, size=row.size)
+        for row in result
+    ]
+
+
+@traced("services.get_conversation_messages")
 async def get_conversation_messages(conversation_id: int, current_user_id: int, db: AsyncSession):
     """Get all messages in a conversation"""
     # Verify user is part of conversation
@@ -181,6 +291,18 @@ async def get_conversation_messages(conversation_id: int, current_user_id: int,
     )
     messages = messages_result.scalars().all()
 
+    # Attachment descriptors for all messages in one query
+    attachments = {}
+    if messages:
+        attachments_result = await db.execute(
+            select(Attachment)
+            .where(Attachment.message_id.in_([msg.id for msg in messages]))
+            .order_by(Attachment.id)
+        )
+        for attachment in attachments_result.scalars():
+            attachments.setdefault(attachment.message_id, []).append(
+                AttachmentDescriptor.model_validate(attachment))
+
     # Get sender details for each message
     message_list = []
     for msg in messages:
@@ -196,14 +318,16 @@ async def get_conversation_messages(conversation_id: int, current_user_id: int,
                     sender_name=sender.name,
                     text=msg.text,
                     created_at=msg.created_at,
-                    is_own=(msg.sender_id == current_user_id)
+                    is_own=(msg.sender_id == current_user_id),
+                    attachments=attachments.get(msg.id, [])
                 )
             )
 
     return message_list
 
 
-async def send_message(conversation_id: int, sender_id: int, text: str, db: AsyncSession):
+@traced("services.send_message")
+async def send_message(conversation_id: int, sender_id: int, text: str, db: AsyncSession, attachment_ids=()):
     """Send a message in a conversation"""
     # Verify conversation exists and user is part of it
     result = await db.execute(select(Conversation).where(Conversation.id == conversation_id))
@@ -224,10 +348,323 @@ async def send_message(conversation_id: int, sender_id: int, text: str, db: Asyn
     )
     db.add(new_message)
 
+    attachments = []
+    if attachment_ids:
+        await db.flush()
+        attachments = await attach_to_message(new_message.id, sender_id, attachment_ids, db)
+        if len(attachments) != len(set(attachment_ids)):
+            await db.rollback()
+            raise HTTPException(status_code=400, detail="Invalid attachment ids")
+
     # Update conversation's last message
-    conversation.last_message = text[:50] + "..." if len(text) > 50 else text
+    conversation.last_message = message_preview(text, attachments)
 
     await db.commit()
     await db.refresh(new_message)
 
-    return new_message
+    await push_conversation_updated(
+        conversation.id, (conversation.user1, conversation.user2),
+        conversation.last_message, sender_id, new_message.created_at
+    )
+
+    return MessageResponse(
+        id=new_message.id,
+        conversation_id=new_message.conversation_id,
+        sender_id=new_message.sender_id,
+        text=new_message.text,
+        created_at=new_message.created_at,
+        attachments=attachments
+    )
+
+
+@traced("services.send_messages_bulk")
+async def send_messages_bulk(sender_id: int, data: BulkMessageCreate, db: AsyncSession) -> BulkMessageResponse:
+    """Send a batch of messages with set-based queries and report per-item results"""
+    if data.conversation_ids and not (data.text and data.text.strip()):
+        raise HTTPException(
+            status_code=400, detail="text is required with conversation_ids")
+
+    items = [(item.conversation_id, item.text) for item in data.items]
+    if data.text is not None:
+        items += [(conversation_id, data.text) for conversation_id in data.conversation_ids]
+
+    if not items:
+        raise HTTPException(status_code=400, detail="No messages to send")
+    if len(items) > MAX_BULK_MESSAGES:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MAX_BULK_MESSAGES} messages per batch")
+
+    # One query validates membership for every conversation in the batch
+    result = await db.execute(
+        select(Conversation.id, Conversation.user1, Conversation.user2)
+        .where(Conversation.id.in_({conversation_id for conversation_id, _ in items}))
+    )
+    participants = {row.id: (row.user1, row.user2) for row in result}
+
+    results = []
+    rows = []
+    for conversation_id, text in items:
+        users = participants.get(conversation_id)
+        if not text.strip():
+            results.append(BulkMessageResult(conversation_id=conversation_id, status="empty"))
+        elif users is None:
+            results.append(BulkMessageResult(conversation_id=conversation_id, status="not_found"))
+        elif sender_id not in users:
+            results.append(BulkMessageResult(conversation_id=conversation_id, status="forbidden"))
+        else:
+            results.append(BulkMessageResult(conversation_id=conversation_id, status="sent"))
+            rows.append({"conversation_id": conversation_id, "sender_id": sender_id, "text": text})
+
+    if not rows:
+        return BulkMessageResponse(sent=0, failed=len(results), results=results)
+
+    # Multi-row INSERT; RETURNING rows come back in parameter order
+    inserted = (await db.execute(
+        insert(Message).returning(
+            Message.id, Message.created_at, sort_by_parameter_order=True),
+        rows
+    )).all()
+
+    # Last message per conversation wins, applied in a single UPDATE
+    last_rows = {}
+    for row, (message_id, created_at) in zip(rows, inserted):
+        last_rows[row["conversation_id"]] = (message_preview(row["text"]), created_at)
+    await db.execute(
+        update(Conversation)
+        .where(Conversation.id.in_(last_rows))
+        .values(
+            last_message=case(
+                {conversation_id: preview for conversation_id, (preview, _) in last_rows.items()},
+                value=Conversation.id
+            ),
+            updated_at=func.now()
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+    sent = iter(inserted)
+    for item_result in results:
+        if item_result.status == "sent":
+            item_result.message_id = next(sent)[0]
+
+    # Fan out to whoever is online
+    sender_result = await db.execute(select(User.name).where(User.id == sender_id))
+    sender_name = sender_result.scalar_one_or_none() or "someone"
+    for row, (message_id, created_at) in zip(rows, inserted):
+        message_payload = {
+            "id": message_id,
+            "conversation_id": row["conversation_id"],
+            "sender_id": sender_id,
+            "sender_name": sender_name,
+            "text": row["text"],
+            "created_at": created_at.isoformat() if created_at else None,
+            # Bulk sends are text only; same shape as single-message frames
+            "attachments": []
+        }
+        for user_id in set(participants[row["conversation_id"]]):
+            await send_to_user(user_id, message_payload)
+
+    for conversation_id, (preview, created_at) in last_rows.items():
+        await push_conversation_updated(
+            conversation_id, participants[conversation_id], preview, sender_id, created_at)
+
+    return BulkMessageResponse(
+        sent=len(rows), failed=len(results) - len(rows), results=results)
+
+# ============= ATTACHMENT SERVICES =============
+
+
+def _upload_expiry_cutoff(db: AsyncSession):
+    # Computed by the database, on the same clock as the server_default now()
+    # that fills updated_at, so it holds whatever timezone the server runs in
+    if db.bind.dialect.name == "sqlite":
+        return func.datetime("now", f"-{UPLOAD_EXPIRY_SECONDS} seconds")
+    return func.now() - timedelta(seconds=UPLOAD_EXPIRY_SECONDS)
+
+
+@traced("services.create_upload")
+async def create_upload(user_id: int, data: UploadCreate, db: AsyncSession) -> UploadStatus:
+    """Start a resumable chunked upload"""
+    if data.size <= 0:
+        raise HTTPException(status_code=400, detail="Invalid file size")
+    if data.size > MAX_ATTACHMENT_BYTES:
+        raise HTTPException(
+            status_code=413, detail=f"Attachments are limited to {MAX_ATTACHMENT_BYTES} bytes")
+
+    # Expired uploads awaiting the sweep don't count against the cap
+    cutoff = _upload_expiry_cutoff(db)
+    result = await db.execute(
+        select(func.count(Upload.id)).where(Upload.user_id == user_id, Upload.updated_at >= cutoff)
+    )
+    if result.scalar_one() >= MAX_OPEN_UPLOADS:
+        raise HTTPException(
+            status_code=429, detail=f"At most {MAX_OPEN_UPLOADS} uploads may be open at once")
+
+    upload = Upload(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        filename=os.path.basename(data.filename) or "file",
+        content_type=data.content_type or "application/octet-stream",
+        size=data.size,
+        received=0
+    )
+    await asyncio.to_thread(create_upload_file, upload.id)
+    db.add(upload)
+    await db.commit()
+
+    return UploadStatus(upload_id=upload.id, offset=0, size=upload.size, chunk_size=CHUNK_SIZE)
+
+
+async def _get_upload(upload_id: str, user_id: int, db: AsyncSession) -> Upload:
+    result = await db.execute(select(Upload).where(Upload.id == upload_id))
+    upload = result.scalar_one_or_none()
+
+    if not upload or upload.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+    return upload
+
+
+@traced("services.get_upload_status")
+async def get_upload_status(upload_id: str, user_id: int, db: AsyncSession) -> UploadStatus:
+    """Report how much of an upload has been received, so clients can resume"""
+    upload = await _get_upload(upload_id, user_id, db)
+    return UploadStatus(upload_id=upload.id, offset=upload.received, size=upload.size, chunk_size=CHUNK_SIZE)
+
+
+@traced("services.upload_chunk")
+async def upload_chunk(upload_id: str, user_id: int, offset: int, chunks, db: AsyncSession) -> UploadStatus:
+    """Stream one chunk of the request body to disk at offset"""
+    upload = await _get_upload(upload_id, user_id, db)
+
+    if offset != upload.received:
+        raise HTTPException(
+            status_code=409, detail=f"Expected offset {upload.received}")
+
+    # Don't hold a pooled connection while the body streams in
+    await db.commit()
+
+    path = chunk_path(upload.id, uuid.uuid4().hex)
+    try:
+        written = await write_chunk(path, chunks, min(CHUNK_SIZE, upload.size - offset))
+        if written < 0:
+            raise HTTPException(status_code=413, detail="Chunk too large")
+
+        # Claim the range: only advance if no concurrent request moved the
+        # offset meanwhile. The row stays locked until commit, so a retry of
+        # the same chunk waits here, then fails the check and never touches
+        # the part file.
+        result = await db.execute(
+            update(Upload)
+            .where(Upload.id == upload.id, Upload.received == offset)
+            .values(received=offset + written)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            await db.rollback()
+            raise HTTPException(status_code=409, detail="Upload offset changed")
+
+        await asyncio.to_thread(splice_chunk, upload.id, path, offset)
+        await db.commit()
+    finally:
+        await asyncio.to_thread(remove_file, path)
+
+    return UploadStatus(upload_id=upload.id, offset=offset + written, size=upload.size, chunk_size=CHUNK_SIZE)
+
+
+@traced("services.complete_upload")
+async def complete_upload(upload_id: str, user_id: int, db: AsyncSession) -> AttachmentResponse:
+    """Hash a fully received upload into the blob store and create its attachment"""
+    upload = await _get_upload(upload_id, user_id, db)
+
+    if upload.received != upload.size:
+        raise HTTPException(
+            status_code=409, detail=f"Upload incomplete: {upload.received} of {upload.size} bytes")
+
+    # Claim the upload by deleting its row before hashing: a concurrent
+    # complete then finds nothing instead of racing for the part file
+    result = await db.execute(
+        delete(Upload)
+        .where(Upload.id == upload.id, Upload.received == Upload.size)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Upload not found")
+    await db.commit()
+
+    sha256 = await asyncio.to_thread(finalize_upload, upload.id)
+
+    attachment = Attachment(
+        uploader_id=user_id,
+        sha256=sha256,
+        filename=upload.filename,
+        content_type=upload.content_type,
+        size=upload.size
+    )
+    db.add(attachment)
+    await db.commit()
+    await db.refresh(attachment)
+
+    return AttachmentResponse.model_validate(attachment)
+
+
+@traced("services.get_attachment")
+async def get_attachment(attachment_id: int, user_id: int, db: AsyncSession) -> Attachment:
+    """Get an attachment the user may download (uploader or conversation participant)"""
+    result = await db.execute(
+        select(Attachment, Conversation.user1, Conversation.user2)
+        .outerjoin(Message, Attachment.message_id == Message.id)
+        .outerjoin(Conversation, Message.conversation_id == Conversation.id)
+        .where(Attachment.id == attachment_id)
+    )
+    row = result.one_or_none()
+
+    if not row:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+
+    attachment, user1, user2 = row
+    if user_id not in (attachment.uploader_id, user1, user2):
+        raise HTTPException(
+            status_code=403, detail="Not authorized to view this attachment")
+
+    return attachment
+
+
+async def expire_uploads(db: AsyncSession) -> int:
+    """Drop uploads that received no chunk within UPLOAD_EXPIRY_SECONDS, with their part files"""
+    cutoff = _upload_expiry_cutoff(db)
+    result = await db.execute(
+        delete(Upload).where(Upload.updated_at < cutoff).returning(Upload.id)
+    )
+    upload_ids = result.scalars().all()
+    await db.commit()
+
+    for upload_id in upload_ids:
+        await asyncio.to_thread(remove_upload_file, upload_id)
+    return len(upload_ids)
+
+
+async def _run_upload_reaper():
+    # A few sweeps per expiry window, but never more than hourly or every minute
+    period = max(60.0, min(3600.0, UPLOAD_EXPIRY_SECONDS / 4))
+    while True:
+        await asyncio.sleep(period)
+        try:
+            async with SessionLocal() as session:
+                await expire_uploads(session)
+        except Exception:
+            traceback.print_exc()
+
+
+def start_upload_reaper():
+    global _upload_reaper_task
+    _upload_reaper_task = asyncio.create_task(_run_upload_reaper())
+
+
+def stop_upload_reaper():
+    global _upload_reaper_task
+    if _upload_reaper_task:
+        _upload_reaper_task.cancel()
+        _upload_reaper_task = None
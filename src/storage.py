@@ -0,0 +1,115 @@
+import asyncio
+import glob
+import hashlib
+import os
+
+# Attachments live on local disk: in-progress uploads under uploads/, finished
+# files under blobs/<aa>/<sha256>, so identical files are stored once
+ATTACHMENT_DIR = os.getenv("ATTACHMENT_DIR", "./attachments")
+MAX_ATTACHMENT_BYTES = int(os.getenv("MAX_ATTACHMENT_BYTES", str(100 * 1024 * 1024)))
+CHUNK_SIZE = int(os.getenv("ATTACHMENT_CHUNK_SIZE", str(4 * 1024 * 1024)))
+# Uploads that receive no chunk for this long are dropped with their part file
+UPLOAD_EXPIRY_SECONDS = float(os.getenv("UPLOAD_EXPIRY_SECONDS", str(24 * 3600)))
+MAX_OPEN_UPLOADS = int(os.getenv("MAX_OPEN_UPLOADS", "20"))
+
+# Unit of blocking file I/O handed to worker threads (hashing, copying, buffered writes)
+_IO_BLOCK = 1024 * 1024
+
+
+def upload_path(upload_id: str) -> str:
+    return os.path.join(ATTACHMENT_DIR, "uploads", f"{upload_id}.part")
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(ATTACHMENT_DIR, "blobs", sha256[:2], sha256)
+
+
+def create_upload_file(upload_id: str):
+    """Create the empty file an upload is written into. Call it via asyncio.to_thread."""
+    path = upload_path(upload_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
+
+
+def chunk_path(upload_id: str, chunk_id: str) -> str:
+    return os.path.join(ATTACHMENT_DIR, "uploads", f"{upload_id}.{chunk_id}.chunk")
+
+
+def remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_upload_file(upload_id: str):
+    """Delete an upload's part file and any chunk files a crashed request left behind"""
+    remove_file(upload_path(upload_id))
+    prefix = glob.escape(os.path.join(ATTACHMENT_DIR, "uploads", f"{upload_id}."))
+    for path in glob.glob(prefix + "*.chunk"):
+        remove_file(path)
+
+
+async def write_chunk(path: str, chunks, limit: int) -> int:
+    """Stream request body chunks into a fresh chunk file.
+
+    Returns the number of bytes written, or -1 if more than limit bytes
+    arrived. Each request gets its own file, so concurrent retries of the
+    same chunk never touch the part file; splice_chunk moves the bytes in
+    once the offset has been claimed. Body chunks are buffered into blocks
+    and every file operation runs in a worker thread, so a slow disk never
+    stalls the event loop.
+    """
+    f = await asyncio.to_thread(open, path, "wb")
+    try:
+        written = 0
+        buffer = bytearray()
+        async for chunk in chunks:
+            written += len(chunk)
+            if written > limit:
+                return -1
+            buffer += chunk
+            if len(buffer) >= _IO_BLOCK:
+                await asyncio.to_thread(f.write, buffer)
+                buffer.clear()
+        if buffer:
+            await asyncio.to_thread(f.write, buffer)
+    finally:
+        await asyncio.to_thread(f.close)
+    return written
+
+
+def splice_chunk(upload_id: str, path: str, offset: int):
+    """Copy a chunk file into the upload's part file at offset. Call it via asyncio.to_thread.
+
+    Anything past the chunk (e.g. from an interrupted earlier attempt) is
+    truncated so the part file always ends where the chunk does.
+    """
+    with open(path, "rb") as src, open(upload_path(upload_id), "r+b") as dst:
+        dst.seek(offset)
+        for block in iter(lambda: src.read(_IO_BLOCK), b""):
+            dst.write(block)
+        dst.truncate()
+
+
+def finalize_upload(upload_id: str) -> str:
+    """Hash a finished upload and move it into the blob store. Returns the sha256.
+
+    Reads the file in blocks (never whole), so call it via asyncio.to_thread.
+    """
+    path = upload_path(upload_id)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_IO_BLOCK), b""):
+            digest.update(block)
+    sha256 = digest.hexdigest()
+
+    target = blob_path(sha256)
+    if os.path.exists(target):
+        # Same content already stored: keep the existing blob
+        os.remove(path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+    return sha256
+
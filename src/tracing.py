@@ -0,0 +1,233 @@
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Everything here is off by default. When disabled, decorators return the
+# original function, span() returns a shared no-op context manager and no
+# SQLAlchemy listeners or middleware are installed.
+TRACING_ENABLED = os.getenv("TRACE_ENABLED", "0") == "1"
+# Tail sampling: only traces at least this slow are emitted
+TRACE_THRESHOLD_MS = float(os.getenv("TRACE_THRESHOLD_MS", "200"))
+# Log any single SQL statement at least this slow (0 disables)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+# Comma-separated user ids allowed to profile; when unset, only loopback clients
+PROFILER_ALLOWED_USER_IDS = {
+    int(user_id) for user_id in os.getenv("PROFILER_ALLOWED_USER_IDS", "").split(",") if user_id.strip()
+}
+
+_NOOP = nullcontext()
+_current_trace = ContextVar("current_trace", default=None)
+
+
+class _Trace:
+    __slots__ = ("name", "start", "spans")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def record(self, name: str, start: float, end: float):
+        self.spans.append((name, start - self.start, end - start))
+
+    def emit(self, duration: float):
+        print("[trace] " + json.dumps({
+            "trace": self.name,
+            "duration_ms": round(duration * 1000, 3),
+            "spans": [
+                {"name": name, "offset_ms": round(offset * 1000, 3), "duration_ms": round(length * 1000, 3)}
+                for name, offset, length in self.spans
+            ]
+        }))
+
+
+class _Root:
+    __slots__ = ("trace", "token")
+
+    def __init__(self, name: str):
+        self.trace = _Trace(name)
+
+    def __enter__(self):
+        self.token = _current_trace.set(self.trace)
+        return self.trace
+
+    def __exit__(self, *exc):
+        _current_trace.reset(self.token)
+        duration = time.perf_counter() - self.trace.start
+        if duration * 1000 >= TRACE_THRESHOLD_MS:
+            self.trace.emit(duration)
+
+
+class _Span:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace: _Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.trace.record(self.name, self.start, time.perf_counter())
+
+
+def trace(name: str):
+    """Start a root trace (one request or one WebSocket frame)"""
+    if not TRACING_ENABLED:
+        return _NOOP
+    return _Root(name)
+
+
+def span(name: str):
+    """Time a block as part of the current trace, if any"""
+    if not TRACING_ENABLED:
+        return _NOOP
+    current = _current_trace.get()
+    if current is None:
+        return _NOOP
+    return _Span(current, name)
+
+
+def traced(name: str):
+    """Decorator recording each call as a span; a no-op when tracing is off"""
+    def decorator(fn):
+        if not TRACING_ENABLED:
+            return fn
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a root trace per HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        with trace(f"{scope['method']} {scope['path']}"):
+            await self.app(scope, receive, send)
+
+
+# ============= DATABASE =============
+
+
+class TracedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records time spent waiting for a connection"""
+
+    def _do_get(self):
+        current = _current_trace.get()
+        if current is None:
+            return super()._do_get()
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            current.record("db.pool_wait", start, time.perf_counter())
+
+
+def engine_options() -> dict:
+    """Extra create_async_engine() arguments for tracing"""
+    if not TRACING_ENABLED:
+        return {}
+    return {"poolclass": TracedPool}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    end = time.perf_counter()
+    start = conn.info["query_start"].pop()
+
+    if TRACING_ENABLED:
+        current = _current_trace.get()
+        if current is not None:
+            current.record("sql: " + " ".join(statement.split())[:80], start, end)
+
+    duration_ms = (end - start) * 1000
+    if SLOW_QUERY_MS and duration_ms >= SLOW_QUERY_MS:
+        # Parameters are left out on purpose: they can carry password hashes
+        print("[slow-query] " + json.dumps({
+            "duration_ms": round(duration_ms, 3),
+            "statement": " ".join(statement.split())[:500]
+        }))
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute; drop its start
+    # time so the next statement on this connection isn't timed against it
+    conn = context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+def instrument_engine(engine):
+    """Attach cursor listeners for SQL spans and the slow-query log"""
+    if not TRACING_ENABLED and not SLOW_QUERY_MS:
+        return
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine.sync_engine, "handle_error", _handle_error)
+
+
+# ============= PROFILER =============
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(thread_id: int, seconds: float, interval: float) -> str:
+    """Sample one thread's stack and return it in collapsed (flamegraph) format.
+
+    Runs in a worker thread so the sampled thread keeps going; each output
+    line is "outer;...;inner count".
+    """
+    counts = Counter()
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            break
+        stack = []
+        while frame is not None:
+            stack.append(_frame_label(frame))
+            frame = frame.f_back
+        counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
+
+
+profiler_lock = threading.Lock()